@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import torch
+
+from videosys.pipelines.open_sora.data_process import (
+    ASPECT_RATIOS,
+    _to_uint8_video,
+    get_closest_ratio,
+    get_closest_ratio_value,
+    get_image_size,
+    get_image_sizes,
+)
+
+
+def baseline_closest_ratio(height, width, ratios):
+    aspect_ratio = height / width
+    return min(ratios.keys(), key=lambda ratio: abs(float(ratio) - aspect_ratio))
+
+
+def probe_ratios(rs_dict):
+    values = sorted(float(k) for k in rs_dict)
+    midpoints = [(a + b) / 2 for a, b in zip(values, values[1:])]
+    # 0.3 and 0.49 are exact midpoints in ASPECT_RATIO_256
+    return values + midpoints + [0.01, 0.3, 0.49, 100.0]
+
+
+@pytest.mark.parametrize("resolution", list(ASPECT_RATIOS))
+def test_get_closest_ratio(resolution):
+    rs_dict = ASPECT_RATIOS[resolution][1]
+    for ar in probe_ratios(rs_dict):
+        expected = baseline_closest_ratio(ar, 1.0, rs_dict)
+        assert get_closest_ratio(ar, 1.0, rs_dict) == expected
+        assert get_closest_ratio(ar, 1.0, resolution) == expected
+
+
+@pytest.mark.parametrize("resolution", list(ASPECT_RATIOS))
+def test_get_closest_ratio_value(resolution):
+    rs_dict = ASPECT_RATIOS[resolution][1]
+    for ar in probe_ratios(rs_dict):
+        ar_key = get_closest_ratio(ar, 1.0, resolution)
+        ar_value = get_closest_ratio_value(ar, 1.0, resolution)
+        assert ar_value == float(ar_key)
+        assert get_image_size(resolution, ar_value) == rs_dict[ar_key]
+
+
+def test_get_image_sizes():
+    resolutions, ars, expected = [], [], []
+    for resolution, (_, rs_dict) in ASPECT_RATIOS.items():
+        for ar in probe_ratios(rs_dict):
+            resolutions.append(resolution)
+            ars.append(ar)
+            expected.append(rs_dict[get_closest_ratio(ar, 1.0, resolution)])
+
+    sizes = get_image_sizes(resolutions, np.array(ars))
+    assert sizes.shape == (len(ars), 2)
+    np.testing.assert_array_equal(sizes, np.array(expected))
+
+
+def test_get_image_sizes_length_mismatch():
+    with pytest.raises(ValueError):
+        get_image_sizes(["256", "512"], np.array([1.0]))
+
+
+def baseline_to_uint8_video(x, low, high):
+    x = x.clone()
+    x.clamp_(min=low, max=high)
+    x.sub_(low).div_(max(high - low, 1e-5))
+    return x.mul(255).add_(0.5).clamp_(0, 255).permute(1, 2, 3, 0).to("cpu", torch.uint8)
+
+
+@pytest.mark.parametrize("dtype", [torch.float32, torch.bfloat16, torch.float16])
+@pytest.mark.parametrize("value_range", [(-1, 1), (0, 1)])
+def test_to_uint8_video(dtype, value_range):
+    low, high = value_range
+    # low, high, midpoint and out-of-range values, laid out as [C, T, H, W]
+    values = [low - 1.0, low, (low + high) / 2, high, high + 1.0]
+    x = torch.tensor(values, dtype=dtype).reshape(1, 1, 1, -1).expand(3, 2, 4, -1).contiguous()
+
+    y = _to_uint8_video(x, low, high)
+    assert y.shape == (2, 4, len(values), 3)
+    assert y.dtype == torch.uint8
+    assert torch.equal(y, baseline_to_uint8_video(x, low, high))
+    assert y[..., 3, :].eq(255).all() and y[..., 4, :].eq(255).all()
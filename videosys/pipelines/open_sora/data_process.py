@@ -8,22 +8,60 @@
 # --------------------------------------------------------
 
 
+import collections
+import functools
+import hashlib
 import numbers
 import os
 import re
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 import requests
 import torch
 import torchvision
 import torchvision.transforms as transforms
+from packaging import version
 from PIL import Image
 from torchvision.datasets.folder import IMG_EXTENSIONS, pil_loader
 from torchvision.io import write_video
 from torchvision.utils import save_image
 
+from videosys.utils.logging import logger
+
+try:
+    import av
+
+    _HAS_NVENC = "h264_nvenc" in av.codecs_available
+except ImportError:
+    av = None
+    _HAS_NVENC = False
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+try:
+    import decord
+except ImportError:
+    decord = None
+
+try:
+    import pyvips
+
+    # Image.new_from_array(ndarray) and Image.numpy() need pyvips >= 2.2
+    if version.parse(pyvips.__version__) < version.parse("2.2"):
+        pyvips = None
+except (ImportError, OSError):
+    pyvips = None
+
 IMG_FPS = 120
 VID_EXTENSIONS = (".mp4", ".avi", ".mov", ".mkv")
+# frames per chunk when decoding to or transforming on the device
+_CHUNK_FRAMES = 16
 
 regex = re.compile(
     r"^(?:http|ftp)s?://"  # http:// or https://
@@ -34,6 +72,7 @@ regex = re.compile(
     r"(?:/?|[/?]\S+)$",
     re.IGNORECASE,
 )
+_URL_MATCH = regex.match
 
 # H:W
 ASPECT_RATIO_MAP = {
@@ -271,138 +310,6 @@ ASPECT_RATIO_2880 = {
     "4.0": (5760, 1408),
 }
 
-# S = 4194304
-ASPECT_RATIO_2048 = {
-    "0.25": (1024, 4096),
-    "0.26": (1024, 3968),
-    "0.27": (1024, 3840),
-    "0.28": (1024, 3712),
-    "0.32": (1152, 3584),
-    "0.33": (1152, 3456),
-    "0.35": (1152, 3328),
-    "0.4": (1280, 3200),
-    "0.42": (1280, 3072),
-    "0.48": (1408, 2944),
-    "0.5": (1408, 2816),
-    "0.52": (1408, 2688),
-    "0.57": (1536, 2688),
-    "0.6": (1536, 2560),
-    "0.68": (1664, 2432),
-    "0.72": (1664, 2304),
-    "0.78": (1792, 2304),
-    "0.82": (1792, 2176),
-    "0.88": (1920, 2176),
-    "0.94": (1920, 2048),
-    "1.0": (2048, 2048),
-    "1.07": (2048, 1920),
-    "1.13": (2176, 1920),
-    "1.21": (2176, 1792),
-    "1.29": (2304, 1792),
-    "1.38": (2304, 1664),
-    "1.46": (2432, 1664),
-    "1.67": (2560, 1536),
-    "1.75": (2688, 1536),
-    "2.0": (2816, 1408),
-    "2.09": (2944, 1408),
-    "2.4": (3072, 1280),
-    "2.5": (3200, 1280),
-    "2.89": (3328, 1152),
-    "3.0": (3456, 1152),
-    "3.11": (3584, 1152),
-    "3.62": (3712, 1024),
-    "3.75": (3840, 1024),
-    "3.88": (3968, 1024),
-    "4.0": (4096, 1024),
-}
-
-# S = 1048576
-ASPECT_RATIO_1024 = {
-    "0.25": (512, 2048),
-    "0.26": (512, 1984),
-    "0.27": (512, 1920),
-    "0.28": (512, 1856),
-    "0.32": (576, 1792),
-    "0.33": (576, 1728),
-    "0.35": (576, 1664),
-    "0.4": (640, 1600),
-    "0.42": (640, 1536),
-    "0.48": (704, 1472),
-    "0.5": (704, 1408),
-    "0.52": (704, 1344),
-    "0.57": (768, 1344),
-    "0.6": (768, 1280),
-    "0.68": (832, 1216),
-    "0.72": (832, 1152),
-    "0.78": (896, 1152),
-    "0.82": (896, 1088),
-    "0.88": (960, 1088),
-    "0.94": (960, 1024),
-    "1.0": (1024, 1024),
-    "1.07": (1024, 960),
-    "1.13": (1088, 960),
-    "1.21": (1088, 896),
-    "1.29": (1152, 896),
-    "1.38": (1152, 832),
-    "1.46": (1216, 832),
-    "1.67": (1280, 768),
-    "1.75": (1344, 768),
-    "2.0": (1408, 704),
-    "2.09": (1472, 704),
-    "2.4": (1536, 640),
-    "2.5": (1600, 640),
-    "2.89": (1664, 576),
-    "3.0": (1728, 576),
-    "3.11": (1792, 576),
-    "3.62": (1856, 512),
-    "3.75": (1920, 512),
-    "3.88": (1984, 512),
-    "4.0": (2048, 512),
-}
-
-# S = 262144
-ASPECT_RATIO_512 = {
-    "0.25": (256, 1024),
-    "0.26": (256, 992),
-    "0.27": (256, 960),
-    "0.28": (256, 928),
-    "0.32": (288, 896),
-    "0.33": (288, 864),
-    "0.35": (288, 832),
-    "0.4": (320, 800),
-    "0.42": (320, 768),
-    "0.48": (352, 736),
-    "0.5": (352, 704),
-    "0.52": (352, 672),
-    "0.57": (384, 672),
-    "0.6": (384, 640),
-    "0.68": (416, 608),
-    "0.72": (416, 576),
-    "0.78": (448, 576),
-    "0.82": (448, 544),
-    "0.88": (480, 544),
-    "0.94": (480, 512),
-    "1.0": (512, 512),
-    "1.07": (512, 480),
-    "1.13": (544, 480),
-    "1.21": (544, 448),
-    "1.29": (576, 448),
-    "1.38": (576, 416),
-    "1.46": (608, 416),
-    "1.67": (640, 384),
-    "1.75": (672, 384),
-    "2.0": (704, 352),
-    "2.09": (736, 352),
-    "2.4": (768, 320),
-    "2.5": (800, 320),
-    "2.89": (832, 288),
-    "3.0": (864, 288),
-    "3.11": (896, 288),
-    "3.62": (928, 256),
-    "3.75": (960, 256),
-    "3.88": (992, 256),
-    "4.0": (1024, 256),
-}
-
 # S = 65536
 ASPECT_RATIO_256 = {
     "0.25": (128, 512),
@@ -448,10 +355,42 @@ ASPECT_RATIO_256 = {
 }
 
 
-def get_closest_ratio(height: float, width: float, ratios: dict):
+def _scale_ratio_table(base, factor):
+    return {ratio: (h * factor, w * factor) for ratio, (h, w) in base.items()}
+
+
+# the larger PixArt tables are exact integer multiples of ASPECT_RATIO_256
+# S = 262144
+ASPECT_RATIO_512 = _scale_ratio_table(ASPECT_RATIO_256, 2)
+# S = 1048576
+ASPECT_RATIO_1024 = _scale_ratio_table(ASPECT_RATIO_256, 4)
+# S = 4194304
+ASPECT_RATIO_2048 = _scale_ratio_table(ASPECT_RATIO_256, 8)
+
+
+def get_closest_ratio(height: float, width: float, ratios):
+    """
+    Args:
+        ratios (str | dict): resolution name in ASPECT_RATIOS, or an aspect ratio table
+    """
     aspect_ratio = height / width
-    closest_ratio = min(ratios.keys(), key=lambda ratio: abs(float(ratio) - aspect_ratio))
-    return closest_ratio
+    if isinstance(ratios, str):
+        ratio_values, ratio_keys, _ = _AR_TABLES[ratios]
+    elif id(ratios) in _RATIO_CACHE:
+        ratio_values, ratio_keys = _RATIO_CACHE[id(ratios)]
+    else:
+        return min(ratios.keys(), key=lambda ratio: abs(float(ratio) - aspect_ratio))
+    return ratio_keys[int(np.abs(ratio_values - aspect_ratio).argmin())]
+
+
+def get_closest_ratio_value(height: float, width: float, resolution: str) -> float:
+    """
+    Float counterpart of get_closest_ratio, the result can be passed to get_image_size.
+    Args:
+        resolution (str): resolution name in ASPECT_RATIOS
+    """
+    ratio_values = _AR_TABLES[resolution][0]
+    return float(ratio_values[int(np.abs(ratio_values - height / width).argmin())])
 
 
 ASPECT_RATIOS = {
@@ -471,11 +410,74 @@ ASPECT_RATIOS = {
 }
 
 
+def _build_ar_table(rs_dict):
+    keys = list(rs_dict)
+    ratio_values = np.asarray([float(k) for k in keys], dtype=np.float64)
+    sizes = np.asarray([rs_dict[k] for k in keys], dtype=np.int32)
+    return ratio_values, keys, sizes
+
+
+# structure-of-arrays view of each table: float64 ratios, their string keys and int32 [N, 2] (H, W),
+# kept in dict order so argmin breaks ties like min() over the dict
+_AR_TABLES = {name: _build_ar_table(rs_dict) for name, (_, rs_dict) in ASPECT_RATIOS.items()}
+# same tables keyed by dict identity, used by get_closest_ratio
+_RATIO_CACHE = {
+    id(ASPECT_RATIOS[name][1]): (ratio_values, keys) for name, (ratio_values, keys, _) in _AR_TABLES.items()
+}
+
+
+# (resolution, "H:W") -> (H, W), merges ASPECT_RATIO_MAP into the tables
+_SIZE_TABLE = {
+    (resolution, ar_ratio): rs_dict[ar_key]
+    for resolution, (_, rs_dict) in ASPECT_RATIOS.items()
+    for ar_ratio, ar_key in ASPECT_RATIO_MAP.items()
+    if ar_key in rs_dict
+}
+# (resolution, float ratio) -> (H, W), for the ratios returned by get_closest_ratio_value
+_SIZE_TABLE.update(
+    {
+        (resolution, float(ar_key)): hw
+        for resolution, (_, rs_dict) in ASPECT_RATIOS.items()
+        for ar_key, hw in rs_dict.items()
+    }
+)
+
+
 def get_image_size(resolution, ar_ratio):
-    ar_key = ASPECT_RATIO_MAP[ar_ratio]
-    rs_dict = ASPECT_RATIOS[resolution][1]
-    assert ar_key in rs_dict, f"Aspect ratio {ar_ratio} not found for resolution {resolution}"
-    return rs_dict[ar_key]
+    """
+    Args:
+        resolution (str): key of ASPECT_RATIOS
+        ar_ratio (str | float): "H:W" key of ASPECT_RATIO_MAP, or a float ratio from get_closest_ratio_value
+    """
+    try:
+        return _SIZE_TABLE[(resolution, ar_ratio)]
+    except KeyError:
+        raise KeyError(f"Aspect ratio {ar_ratio} not found for resolution {resolution}") from None
+
+
+def get_image_sizes(resolutions, ars):
+    """
+    Batched lookup of the closest (H, W) for each sample.
+    Args:
+        resolutions (list[str]): resolution of each sample, keys of ASPECT_RATIOS
+        ars (np.ndarray): height / width aspect ratio of each sample
+    Returns:
+        np.ndarray: int32 array of shape [N, 2] holding (H, W)
+    """
+    resolutions = np.asarray(resolutions)
+    ars = np.asarray(ars, dtype=np.float64)
+    if resolutions.ndim != 1 or resolutions.shape != ars.shape:
+        raise ValueError(
+            f"resolutions and ars should be 1D with the same length, instead got {resolutions.shape} and {ars.shape}"
+        )
+    sizes = np.empty((len(ars), 2), dtype=np.int32)
+    for resolution in np.unique(resolutions):
+        mask = resolutions == resolution
+        ratio_values, _, rs_sizes = _AR_TABLES[resolution]
+        # same float64 distances and first-match tie breaking as get_closest_ratio
+        idx = np.abs(ars[mask, None] - ratio_values[None, :]).argmin(axis=1)
+        sizes[mask] = rs_sizes[idx]
+    return sizes
 
 
 NUM_FRAMES_MAP = {
@@ -512,30 +514,131 @@ def save_sample(x, save_path=None, fps=8, normalize=True, value_range=(-1, 1), f
         save_image([x], save_path, normalize=normalize, value_range=value_range)
     else:
         save_path += ".mp4"
-        if normalize:
-            low, high = value_range
-            x.clamp_(min=low, max=high)
-            x.sub_(low).div_(max(high - low, 1e-5))
-
-        x = x.mul(255).add_(0.5).clamp_(0, 255).permute(1, 2, 3, 0).to("cpu", torch.uint8)
-        write_video(save_path, x, fps=fps, video_codec="h264")
+        low, high = value_range if normalize else (0, 1)
+        to_uint8 = _to_uint8_video_cuda if x.is_cuda else _to_uint8_video
+        x = to_uint8(x, low, high)
+        if _HAS_NVENC and x.is_cuda:
+            try:
+                _write_video_nvenc(save_path, x, fps)
+            except av.error.FFmpegError:
+                # encoder listed by FFmpeg but no usable NVENC device
+                write_video(save_path, x.to("cpu"), fps=fps, video_codec="h264")
+        else:
+            write_video(save_path, x.to("cpu"), fps=fps, video_codec="h264")
     if verbose:
         print(f"Saved to {save_path}")
     return save_path
 
 
+def _to_uint8_video(x, low, high):
+    """
+    Args:
+        x (Tensor): shape [C, T, H, W] with values in [low, high]
+    Return:
+        Tensor: uint8 tensor of shape [T, H, W, C]
+    """
+    scale = 255.0 / max(high - low, 1e-5)
+    # (x - low) * scale + 0.5 folded into one mul and one add; the final clamp is still needed
+    # since half precision rounds 255.5 up to 256, which would wrap when cast to uint8
+    x = x.clamp(low, high).mul_(scale).add_(0.5 - low * scale).clamp_(0, 255).to(torch.uint8)
+    return x.permute(1, 2, 3, 0).contiguous()
+
+
+# None until the first CUDA save, then the compiled _to_uint8_video or the eager fallback
+_to_uint8_video_impl = None
+
+
+def _to_uint8_video_cuda(x, low, high):
+    """
+    _to_uint8_video through torch.compile, which fuses the elementwise chain into a
+    single kernel. Compiled lazily so importing this module does not pull in
+    torch._dynamo, with dynamic shapes since every saved clip has a new shape. If
+    compilation fails, the eager function is used from then on.
+    """
+    global _to_uint8_video_impl
+    if _to_uint8_video_impl is None:
+        if hasattr(torch, "compile"):
+            _to_uint8_video_impl = torch.compile(_to_uint8_video, fullgraph=True, dynamic=True)
+        else:
+            _to_uint8_video_impl = _to_uint8_video
+    if _to_uint8_video_impl is _to_uint8_video:
+        return _to_uint8_video(x, low, high)
+    try:
+        return _to_uint8_video_impl(x, low, high)
+    except Exception as e:
+        # inductor can fail on the first call, e.g. without Triton, on GPUs older than sm70 or on Windows
+        logger.warning(f"torch.compile failed for the video uint8 conversion, falling back to eager: {e}")
+        _to_uint8_video_impl = _to_uint8_video
+        return _to_uint8_video(x, low, high)
+
+
+def _write_video_nvenc(save_path, x, fps):
+    """
+    Encode with the NVENC hardware encoder. Frames are copied to the host in
+    blocks through two pinned buffers, so the copy of the next block overlaps
+    with encoding the current one.
+    Args:
+        x (Tensor): uint8 CUDA tensor of shape [T, H, W, C]
+    """
+    block_size = max(1, min(_CHUNK_FRAMES, x.shape[0]))
+    buffers = [torch.empty((block_size, *x.shape[1:]), dtype=torch.uint8, pin_memory=True) for _ in range(2)]
+
+    def copy_block(idx):
+        block = x[idx * block_size : (idx + 1) * block_size]
+        buffer = buffers[idx % 2][: block.shape[0]]
+        buffer.copy_(block, non_blocking=True)
+        event = torch.cuda.Event()
+        # the copy is queued on the stream of x's device, which need not be the current device
+        event.record(torch.cuda.current_stream(x.device))
+        return buffer, event
+
+    num_blocks = (x.shape[0] + block_size - 1) // block_size
+    with av.open(save_path, mode="w") as container:
+        stream = container.add_stream("h264_nvenc", rate=round(fps))
+        stream.width = x.shape[2]
+        stream.height = x.shape[1]
+        stream.pix_fmt = "yuv420p"
+        # constant-quality VBR, roughly matching the libx264 defaults (preset medium, crf 23) of write_video
+        stream.options = {"preset": "medium", "rc": "vbr", "cq": "23", "b": "0"}
+
+        pending = copy_block(0)
+        for idx in range(num_blocks):
+            buffer, event = pending
+            if idx + 1 < num_blocks:
+                # the other buffer was fully encoded in the previous iteration, so it can be refilled
+                pending = copy_block(idx + 1)
+            event.synchronize()
+            for frame_arr in buffer.numpy():
+                frame = av.VideoFrame.from_ndarray(frame_arr, format="rgb24")
+                for packet in stream.encode(frame):
+                    container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+
+
 def is_url(url):
-    return re.match(regex, url) is not None
+    return _URL_MATCH(url) is not None
 
 
 def download_url(input_path):
     output_dir = "cache"
     os.makedirs(output_dir, exist_ok=True)
     base_name = os.path.basename(input_path)
-    output_path = os.path.join(output_dir, base_name)
-    img_data = requests.get(input_path).content
-    with open(output_path, "wb") as handler:
-        handler.write(img_data)
+    # prefix a hash of the URL so different URLs with the same file name never share a cache path
+    url_hash = hashlib.sha1(input_path.encode()).hexdigest()[:16]
+    output_path = os.path.join(output_dir, f"{url_hash}_{base_name}")
+    # stream to a temporary file in 1 MB chunks and move it into place once complete,
+    # so concurrent downloads of the same URL never expose a partially written file
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as handler, requests.get(input_path, stream=True) as response:
+            response.raise_for_status()
+            for chunk in response.iter_content(chunk_size=1 << 20):
+                handler.write(chunk)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
     print(f"URL {input_path} downloaded to {output_path}")
     return output_path
 
@@ -543,26 +646,39 @@ def download_url(input_path):
 def get_transforms_video(name="center", image_size=(256, 256)):
     if name is None:
         return None
-    elif name == "center":
+    return _get_transforms_video_cached(name, tuple(image_size))
+
+
+# the transforms are stateless, so a single instance can be shared between callers
+@functools.lru_cache(maxsize=32)
+def _get_transforms_video_cached(name, image_size):
+    if name == "center":
         assert image_size[0] == image_size[1], "image_size must be square for center crop"
+        # video_transforms.RandomHorizontalFlipVideo(),
+        crop_video = UCFCenterCropVideo(image_size[0])
+    elif name == "resize_crop":
+        crop_video = ResizeCrop(image_size)
+    else:
+        raise NotImplementedError(f"Transform {name} not implemented")
+
+    if torch.cuda.is_available():
+        # normalization is affine, so applying it before the resize gives the same result
         transform_video = transforms.Compose(
             [
-                ToTensorVideo(),  # TCHW
-                # video_transforms.RandomHorizontalFlipVideo(),
-                UCFCenterCropVideo(image_size[0]),
-                transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5], inplace=True),
+                ToTensorVideoGPU(),  # TCHW
+                crop_video,
             ]
         )
-    elif name == "resize_crop":
+        # only one chunk of frames is held on the device as float at the source resolution
+        transform_video = ChunkedVideoTransform(transform_video)
+    else:
         transform_video = transforms.Compose(
             [
                 ToTensorVideo(),  # TCHW
-                ResizeCrop(image_size),
+                crop_video,
                 transforms.Normalize(mean=[0.5, 0.5, 0.5], std=[0.5, 0.5, 0.5], inplace=True),
             ]
         )
-    else:
-        raise NotImplementedError(f"Transform {name} not implemented")
     return transform_video
 
 
@@ -589,12 +705,25 @@ def center_crop(clip, crop_size):
     return crop(clip, i, j, th, tw)
 
 
-def resize_scale(clip, target_size, interpolation_mode):
+def resize_scale(clip, target_size, interpolation_mode, channels_last=False):
+    """
+    Args:
+        clip (torch.tensor): Video clip to be resized. Size is (T, C, H, W).
+            Pass a CUDA tensor to use the fused antialiased CUDA kernel.
+    """
     if len(target_size) != 2:
         raise ValueError(f"target size should be tuple (height, width), instead got {target_size}")
     H, W = clip.size(-2), clip.size(-1)
     scale_ = target_size[0] / min(H, W)
-    return torch.nn.functional.interpolate(clip, scale_factor=scale_, mode=interpolation_mode, align_corners=False)
+    if channels_last:
+        clip = clip.contiguous(memory_format=torch.channels_last)
+    return torch.nn.functional.interpolate(
+        clip,
+        scale_factor=scale_,
+        mode=interpolation_mode,
+        align_corners=False,
+        antialias=interpolation_mode in ("bilinear", "bicubic"),
+    )
 
 
 class UCFCenterCropVideo:
@@ -607,6 +736,7 @@ class UCFCenterCropVideo:
         self,
         size,
         interpolation_mode="bilinear",
+        channels_last=False,
     ):
         if isinstance(size, tuple):
             if len(size) != 2:
@@ -616,21 +746,31 @@ class UCFCenterCropVideo:
             self.size = (size, size)
 
         self.interpolation_mode = interpolation_mode
+        self.channels_last = channels_last
 
     def __call__(self, clip):
         """
         Args:
-            clip (torch.tensor): Video clip to be cropped. Size is (T, C, H, W)
+            clip (torch.tensor): Video clip to be cropped. Size is (T, C, H, W).
+                Should already be on the target device, e.g. via ToTensorVideoGPU
         Returns:
             torch.tensor: scale resized / center cropped video clip.
                 size is (T, C, crop_size, crop_size)
         """
-        clip_resize = resize_scale(clip=clip, target_size=self.size, interpolation_mode=self.interpolation_mode)
+        clip_resize = resize_scale(
+            clip=clip,
+            target_size=self.size,
+            interpolation_mode=self.interpolation_mode,
+            channels_last=self.channels_last,
+        )
         clip_center_crop = center_crop(clip_resize, self.size)
         return clip_center_crop
 
     def __repr__(self) -> str:
-        return f"{self.__class__.__name__}(size={self.size}, interpolation_mode={self.interpolation_mode}"
+        return (
+            f"{self.__class__.__name__}(size={self.size}, interpolation_mode={self.interpolation_mode}, "
+            f"channels_last={self.channels_last})"
+        )
 
 
 def _is_tensor_video_clip(clip):
@@ -681,6 +821,69 @@ class ToTensorVideo:
         return self.__class__.__name__
 
 
+def to_tensor_gpu(clip, device="cuda"):
+    """
+    Upload a uint8 clip to the device and map it to [-1, 1], which equals
+    to_tensor followed by Normalize(mean=0.5, std=0.5)
+    Args:
+        clip (torch.tensor, dtype=torch.uint8): Size is (T, C, H, W)
+    Return:
+        clip (torch.tensor, dtype=torch.float): Size is (T, C, H, W)
+    """
+    _is_tensor_video_clip(clip)
+    if not clip.dtype == torch.uint8:
+        raise TypeError("clip tensor should have data type uint8. Got %s" % str(clip.dtype))
+    if clip.device.type == "cpu":
+        clip = clip.pin_memory()
+    clip = clip.to(device, non_blocking=True)
+    return clip.to(torch.float32).mul_(1 / 127.5).sub_(1.0)
+
+
+class ToTensorVideoGPU:
+    """
+    Upload the uint8 clip to the device, convert it to float and normalize it
+    to [-1, 1] there
+    """
+
+    def __init__(self, device="cuda"):
+        self.device = device
+
+    def __call__(self, clip):
+        """
+        Args:
+            clip (torch.tensor, dtype=torch.uint8): Size is (T, C, H, W)
+        Return:
+            clip (torch.tensor, dtype=torch.float): Size is (T, C, H, W)
+        """
+        return to_tensor_gpu(clip, self.device)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(device={self.device})"
+
+
+class ChunkedVideoTransform:
+    """
+    Apply a frame-wise transform to a clip in chunks along T and concatenate
+    the results, bounding the memory of full-resolution intermediates
+    """
+
+    def __init__(self, transform, chunk_size=_CHUNK_FRAMES):
+        self.transform = transform
+        self.chunk_size = chunk_size
+
+    def __call__(self, clip):
+        """
+        Args:
+            clip (torch.tensor): Size is (T, C, H, W)
+        Return:
+            clip (torch.tensor): transformed clip, concatenated along T
+        """
+        return torch.cat([self.transform(chunk) for chunk in clip.split(self.chunk_size)], dim=0)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(transform={self.transform}, chunk_size={self.chunk_size})"
+
+
 class ResizeCrop:
     def __init__(self, size):
         if isinstance(size, numbers.Number):
@@ -699,7 +902,12 @@ class ResizeCrop:
 def get_transforms_image(name="center", image_size=(256, 256)):
     if name is None:
         return None
-    elif name == "center":
+    return _get_transforms_image_cached(name, tuple(image_size))
+
+
+@functools.lru_cache(maxsize=32)
+def _get_transforms_image_cached(name, image_size):
+    if name == "center":
         assert image_size[0] == image_size[1], "Image size must be square for center crop"
         transform = transforms.Compose(
             [
@@ -727,43 +935,126 @@ def center_crop_arr(pil_image, image_size):
     Center cropping implementation from ADM.
     https://github.com/openai/guided-diffusion/blob/8fb3ad9197f16bbc40620447b2742e13458d2831/guided_diffusion/image_datasets.py#L126
     """
-    while min(*pil_image.size) >= 2 * image_size:
-        pil_image = pil_image.resize(tuple(x // 2 for x in pil_image.size), resample=Image.BOX)
-
     scale = image_size / min(*pil_image.size)
-    pil_image = pil_image.resize(tuple(round(x * scale) for x in pil_image.size), resample=Image.BICUBIC)
+    new_size = tuple(round(x * scale) for x in pil_image.size)
+    crop_x = (new_size[0] - image_size) // 2
+    crop_y = (new_size[1] - image_size) // 2
+    box = (crop_x, crop_y, crop_x + image_size, crop_y + image_size)
+    # reducing_gap lets PIL do the BOX reduction and the BICUBIC resample in one call
+    return _resize_and_crop(pil_image, new_size, box, reducing_gap=2.0)
 
-    arr = np.array(pil_image)
-    crop_y = (arr.shape[0] - image_size) // 2
-    crop_x = (arr.shape[1] - image_size) // 2
-    return Image.fromarray(arr[crop_y : crop_y + image_size, crop_x : crop_x + image_size])
 
+# Image resize backends, in order of preference: libvips (pyvips), OpenCV, Pillow.
+# Their filters differ slightly, so the exact output pixels depend on which one is installed.
+def _resize_and_crop(pil_image, size, box, reducing_gap=None):
+    """
+    Args:
+        size (tuple): target (W, H)
+        box (tuple): (left, upper, right, lower) crop applied after the resize
+        reducing_gap (float): passed to PIL's resize when Pillow is used
+    Returns:
+        PIL.Image: resized and cropped image
+    """
+    if pyvips is not None:
+        image = _vips_resize(pil_image, size, box)
+        if image is not None:
+            return image
 
-def resize_crop_to_fill(pil_image, image_size):
-    w, h = pil_image.size  # PIL is (W, H)
-    th, tw = image_size
+    if cv2 is not None:
+        # INTER_AREA averages in a single pass when shrinking but is close to nearest neighbour when enlarging
+        w, h = pil_image.size
+        interpolation = cv2.INTER_AREA if size[0] <= w and size[1] <= h else cv2.INTER_CUBIC
+        arr = cv2.resize(np.asarray(pil_image), size, interpolation=interpolation)
+        left, upper, right, lower = box
+        return Image.fromarray(arr[upper:lower, left:right])
+
+    # stock Pillow bicubic is scalar C, installing pillow-simd instead speeds this up with no code change
+    image = pil_image.resize(size, resample=Image.BICUBIC, reducing_gap=reducing_gap)
+    return image.crop(box)
+
+
+def _vips_resize(pil_image, size, box):
+    """
+    Bicubic resize with libvips, which streams the image through SIMD kernels.
+    Args:
+        size (tuple): target (W, H)
+        box (tuple): (left, upper, right, lower) crop applied after the resize
+    Returns:
+        PIL.Image: resized and cropped image, or None if libvips rounded the
+            output to a size other than the requested one
+    """
+    w, h = pil_image.size
+    image = pyvips.Image.new_from_array(np.asarray(pil_image))
+    image = image.resize(size[0] / w, vscale=size[1] / h, kernel="cubic")
+    if (image.width, image.height) != tuple(size):
+        return None
+    image = image.crop(box[0], box[1], box[2] - box[0], box[3] - box[1])
+    return Image.fromarray(image.numpy())
+
+
+@functools.lru_cache(maxsize=256)
+def _resize_crop_params(h, w, th, tw):
+    """
+    Returns the resized size (sh, sw) and crop offset (i, j) used by resize_crop_to_fill.
+    """
     rh, rw = th / h, tw / w
     if rh > rw:
         sh, sw = th, round(w * rh)
-        image = pil_image.resize((sw, sh), Image.BICUBIC)
         i = 0
         j = int(round((sw - tw) / 2.0))
     else:
         sh, sw = round(h * rw), tw
-        image = pil_image.resize((sw, sh), Image.BICUBIC)
         i = int(round((sh - th) / 2.0))
         j = 0
-    arr = np.array(image)
-    assert i + th <= arr.shape[0] and j + tw <= arr.shape[1]
-    return Image.fromarray(arr[i : i + th, j : j + tw])
+    return sh, sw, i, j
+
+
+def resize_crop_to_fill(pil_image, image_size):
+    w, h = pil_image.size  # PIL is (W, H)
+    th, tw = image_size
+    sh, sw, i, j = _resize_crop_params(h, w, th, tw)
+    assert i + th <= sh and j + tw <= sw
+    box = (j, i, j + tw, i + th)
+    return _resize_and_crop(pil_image, (sw, sh), box)
+
+
+# decode requests from concurrent readers go to the NVDEC engine one at a time
+_NVDEC_LOCK = threading.Lock()
+
+
+def _read_video_nvdec(path, transform):
+    """
+    Decode a video with NVDEC straight into device memory, _CHUNK_FRAMES frames
+    at a time, applying the frame-wise transform to each chunk so the whole
+    decoded video is never resident on the device.
+    Returns:
+        torch.tensor: transformed clip of size (T, C, H, W)
+    """
+    vr = decord.VideoReader(path, ctx=decord.gpu(torch.cuda.current_device()))
+    chunks = []
+    for start in range(0, len(vr), _CHUNK_FRAMES):
+        indices = list(range(start, min(start + _CHUNK_FRAMES, len(vr))))
+        with _NVDEC_LOCK:
+            vframes = torch.from_dlpack(vr.get_batch(indices).to_dlpack())  # T H W C
+        chunks.append(transform(vframes.permute(0, 3, 1, 2)))
+    return torch.cat(chunks, dim=0)
 
 
 def read_video_from_path(path, transform=None, transform_name="center", image_size=(256, 256)):
-    vframes, aframes, info = torchvision.io.read_video(filename=path, pts_unit="sec", output_format="TCHW")
-    if transform is None:
-        transform = get_transforms_video(image_size=image_size, name=transform_name)
-    video = transform(vframes)  # T C H W
-    video = video.permute(1, 0, 2, 3)
+    video = None
+    # only the built-in transforms are known to be frame-wise, so custom ones get the whole clip
+    if transform is None and decord is not None and torch.cuda.is_available():
+        try:
+            video = _read_video_nvdec(path, get_transforms_video(image_size=image_size, name=transform_name))
+        except decord.DECORDError:
+            # decord built without CUDA support or unsupported codec
+            video = None
+    if video is None:
+        vframes, aframes, info = torchvision.io.read_video(filename=path, pts_unit="sec", output_format="TCHW")
+        if transform is None:
+            transform = get_transforms_video(image_size=image_size, name=transform_name)
+        video = transform(vframes)  # T C H W
+    video = video.permute(1, 0, 2, 3)  # C T H W view, no copy
     return video
 
 
@@ -778,13 +1069,39 @@ def read_from_path(path, image_size, transform_name="center"):
         return read_image_from_path(path, image_size=image_size, transform_name=transform_name)
 
 
+def read_many_from_path(paths, image_size, transform_name="center", max_workers=4):
+    """
+    Read several files concurrently, overlapping download, disk I/O and decode.
+    At most max_workers files are read ahead of the consumer, which bounds memory.
+    Yields:
+        outputs of read_from_path in the order of paths
+    """
+    # worker threads start on the default CUDA device, so pin them to the caller's device
+    device = torch.cuda.current_device() if torch.cuda.is_available() else None
+
+    def read(path):
+        if device is None:
+            return read_from_path(path, image_size, transform_name=transform_name)
+        with torch.cuda.device(device):
+            return read_from_path(path, image_size, transform_name=transform_name)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = collections.deque()
+        for path in paths:
+            if len(pending) == max_workers:
+                yield pending.popleft().result()
+            pending.append(executor.submit(read, path))
+        while pending:
+            yield pending.popleft().result()
+
+
 def read_image_from_path(path, transform=None, transform_name="center", num_frames=1, image_size=(256, 256)):
     image = pil_loader(path)
     if transform is None:
         transform = get_transforms_image(image_size=image_size, name=transform_name)
     image = transform(image)
-    video = image.unsqueeze(0).repeat(num_frames, 1, 1, 1)
-    video = video.permute(1, 0, 2, 3)
+    # C T H W view sharing the single frame; call .contiguous() if a real copy is needed
+    video = image.unsqueeze(1).expand(-1, num_frames, -1, -1)
     return video
 
 
@@ -792,16 +1109,22 @@ def prepare_multi_resolution_info(info_type, batch_size, image_size, num_frames,
     if info_type is None:
         return dict()
     elif info_type == "PixArtMS":
-        hw = torch.tensor([image_size], device=device, dtype=dtype).repeat(batch_size, 1)
-        ar = torch.tensor([[image_size[0] / image_size[1]]], device=device, dtype=dtype).repeat(batch_size, 1)
+        # the values are only read downstream, so a broadcast view of one row is enough
+        hw = torch.tensor([image_size], device=device, dtype=dtype).expand(batch_size, -1)
+        ar = torch.full((batch_size, 1), image_size[0] / image_size[1], device=device, dtype=dtype)
         return dict(ar=ar, hw=hw)
     elif info_type in ["STDiT2", "OpenSora"]:
         fps = fps if num_frames > 1 else IMG_FPS
-        fps = torch.tensor([fps], device=device, dtype=dtype).repeat(batch_size)
-        height = torch.tensor([image_size[0]], device=device, dtype=dtype).repeat(batch_size)
-        width = torch.tensor([image_size[1]], device=device, dtype=dtype).repeat(batch_size)
-        num_frames = torch.tensor([num_frames], device=device, dtype=dtype).repeat(batch_size)
-        ar = torch.tensor([image_size[0] / image_size[1]], device=device, dtype=dtype).repeat(batch_size)
-        return dict(height=height, width=width, num_frames=num_frames, ar=ar, fps=fps)
+
+        def fill(value):
+            return torch.full((batch_size,), float(value), device=device, dtype=dtype)
+
+        return dict(
+            height=fill(image_size[0]),
+            width=fill(image_size[1]),
+            num_frames=fill(num_frames),
+            ar=fill(image_size[0] / image_size[1]),
+            fps=fill(fps),
+        )
     else:
         raise NotImplementedError
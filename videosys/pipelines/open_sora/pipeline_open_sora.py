@@ -19,7 +19,7 @@ from videosys.models.transformers.open_sora_transformer_3d import STDiT3
 from videosys.schedulers.scheduling_rflow_open_sora import RFLOW
 from videosys.utils.utils import save_video, set_seed
 
-from .data_process import get_image_size, get_num_frames, prepare_multi_resolution_info, read_from_path
+from .data_process import get_image_size, get_num_frames, prepare_multi_resolution_info, read_many_from_path
 
 os.environ["TOKENIZERS_PARALLELISM"] = "true"
 
@@ -741,8 +741,7 @@ def collect_references_batch(reference_paths, vae, image_size):
             continue
         ref_path = reference_path.split(";")
         ref = []
-        for r_path in ref_path:
-            r = read_from_path(r_path, image_size, transform_name="resize_crop")
+        for r in read_many_from_path(ref_path, image_size, transform_name="resize_crop"):
             r_x = vae.encode(r.unsqueeze(0).to(vae.device, vae.dtype))
             r_x = r_x.squeeze(0)
             ref.append(r_x)